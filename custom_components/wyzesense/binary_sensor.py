@@ -6,6 +6,8 @@ v0.0.9
 """
 
 from .wyzesense_custom import *
+from .state_hold import StateHold
+from .sensor_manager import SensorManager
 import logging
 import voluptuous as vol
 import json
@@ -24,6 +26,7 @@ try:
 except ImportError:
     from homeassistant.components.binary_sensor import BinarySensorDevice as BinarySensorEntity, PLATFORM_SCHEMA, DEVICE_CLASS_MOTION, DEVICE_CLASS_DOOR
 
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.restore_state import RestoreEntity
 
 import homeassistant.helpers.config_validation as cv
@@ -31,24 +34,66 @@ import homeassistant.helpers.config_validation as cv
 DOMAIN = "wyzesense"
 
 STORAGE = ".storage/wyzesense.json"
+DONGLE_STORAGE = ".storage/wyzesense_dongle.json"
+TRACE_FILE = "wyzesense_trace.bin"
+EXPORT_FILE = "wyzesense_export.json"
 
 ATTR_MAC = "mac"
 ATTR_RSSI = "rssi"
 ATTR_AVAILABLE = "available"
+ATTR_LATENCY = "latency"
+ATTR_CLOCK_SKEW = "clock_skew"
+ATTR_ENABLED = "enabled"
+ATTR_HUB_MAC = "hub_mac"
+ATTR_HUB_VERSION = "hub_version"
 CONF_INITIAL_STATE = "initial_state"
+CONF_CLOCK_CORRECTION = "clock_correction"
+CONF_CLOCK_SMOOTHING = "clock_smoothing"
+CONF_PROCESS_ISOLATION = "process_isolation"
+CONF_SENSORS = "sensors"
+CONF_DEBOUNCE = "debounce"
+CONF_MIN_ON_TIME = "min_on_time"
+CONF_OFF_DELAY = "off_delay"
+
+SENSOR_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DEBOUNCE, default = 0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_MIN_ON_TIME, default = 0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_OFF_DELAY, default = 0): vol.All(vol.Coerce(float), vol.Range(min=0))
+})
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Optional(CONF_DEVICE, default = "auto"): cv.string, 
-    vol.Optional(CONF_INITIAL_STATE, default={}): vol.Schema({cv.string : vol.In(["on","off"])})
+    vol.Optional(CONF_INITIAL_STATE, default={}): vol.Schema({cv.string : vol.In(["on","off"])}),
+    vol.Optional(CONF_CLOCK_CORRECTION, default = True): cv.boolean,
+    vol.Optional(CONF_CLOCK_SMOOTHING, default = 0.05): vol.All(vol.Coerce(float), vol.Range(min=0, max=1)),
+    vol.Optional(CONF_PROCESS_ISOLATION, default = False): cv.boolean,
+    vol.Optional(CONF_SENSORS, default={}): vol.Schema({cv.string : SENSOR_SCHEMA})
 })
 
 SERVICE_SCAN = 'scan'
 SERVICE_REMOVE = 'remove'
+SERVICE_TRACE = 'trace'
+SERVICE_RECONCILE = 'reconcile'
+SERVICE_EXPORT = 'export'
+SERVICE_IMPORT = 'import'
 
 SERVICE_SCAN_SCHEMA = vol.Schema({})
 
 SERVICE_REMOVE_SCHEMA = vol.Schema({
-    vol.Required(ATTR_MAC): cv.string
+    vol.Required(ATTR_MAC): vol.All(cv.ensure_list, [cv.string], vol.Length(min=1))
+})
+
+SERVICE_RECONCILE_SCHEMA = vol.Schema({})
+
+SERVICE_EXPORT_SCHEMA = vol.Schema({
+    vol.Optional(CONF_FILENAME, default = EXPORT_FILE): cv.string
+})
+
+SERVICE_IMPORT_SCHEMA = SERVICE_EXPORT_SCHEMA
+
+SERVICE_TRACE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENABLED): cv.boolean,
+    vol.Optional(CONF_FILENAME, default = TRACE_FILE): cv.string
 })
 
 _LOGGER = logging.getLogger(__name__)
@@ -63,6 +108,28 @@ def setStorage(hass,data):
     with open(hass.config.path(STORAGE),'w') as f:
         json.dump(data, f)
 
+def getDongleStorage(hass):
+    if not path.exists(hass.config.path(DONGLE_STORAGE)):
+        return {}
+    with open(hass.config.path(DONGLE_STORAGE),'r') as f:
+        return json.load(f)
+
+def setDongleStorage(hass,data):
+    with open(hass.config.path(DONGLE_STORAGE),'w') as f:
+        json.dump(data, f)
+
+def getUsbPath(device):
+    """Returns the sysfs path of the USB interface behind a hidraw node.
+
+    Unlike /dev/hidrawN this stays the same across reboots, as long as the
+    dongle stays in the same port. Falls back to the device path itself.
+    """
+    name = path.basename(path.realpath(device))
+    hid = path.realpath("/sys/class/hidraw/%s/device" % name)
+    if not path.exists(hid):
+        return device
+    return path.dirname(hid)
+
 def findDongle():
     df = subprocess.check_output(["ls", "-la", "/sys/class/hidraw"]).decode('utf-8').lower()
     for l in df.split('\n'):
@@ -80,6 +147,39 @@ def setup_platform(hass, config, add_entites, discovery_info=None):
     forced_initial_states = config[CONF_INITIAL_STATE]
     entities = {}
 
+    def update_entity(mac, data):
+        entity = entities.get(mac)
+        if entity is None:
+            return
+        entity._data = data
+        # From https://github.com/kevinvincent/ha-wyzesense/issues/189
+        try:
+            entity.schedule_update_ha_state()
+        except (AttributeError, AssertionError):
+            _LOGGER.debug("wyze Sensor not yet ready for update")
+
+    cancel_timer = None
+
+    def schedule(delay, action):
+        # Called from the dongle thread, so hand the shared timer over to the
+        # event loop instead of waiting for it
+        def reschedule():
+            nonlocal cancel_timer
+            if cancel_timer:
+                cancel_timer()
+                cancel_timer = None
+            if delay is not None:
+                cancel_timer = async_call_later(hass, delay, action)
+        hass.loop.call_soon_threadsafe(reschedule)
+
+    # Debounce, minimum on-time and off-delay for sensors that configure them
+    state_hold = StateHold(
+        {mac.upper(): (options[CONF_DEBOUNCE], options[CONF_MIN_ON_TIME], options[CONF_OFF_DELAY])
+            for mac, options in config[CONF_SENSORS].items()},
+        lambda mac: entities[mac]._data[ATTR_STATE],
+        update_entity,
+        schedule)
+
     def on_event(ws, event):
         if event.Type == 'state':
             (sensor_type, sensor_state, sensor_battery, sensor_signal) = event.Data
@@ -90,13 +190,15 @@ def setup_platform(hass, config, add_entites, discovery_info=None):
                 ATTR_DEVICE_CLASS: DEVICE_CLASS_MOTION if sensor_type == "motion" else DEVICE_CLASS_DOOR ,
                 DEVICE_CLASS_TIMESTAMP: event.Timestamp.isoformat(),
                 ATTR_RSSI: sensor_signal * -1,
-                ATTR_BATTERY_LEVEL: sensor_battery
+                ATTR_BATTERY_LEVEL: sensor_battery,
+                ATTR_LATENCY: None if event.Latency is None else round(event.Latency, 3),
+                ATTR_CLOCK_SKEW: None if ws.ClockOffset is None else round(ws.ClockOffset, 3)
             }
 
             _LOGGER.debug(data)
 
             if not event.MAC in entities:
-                new_entity = WyzeSensor(data)
+                new_entity = WyzeSensor(data, hub = ws.Capabilities)
                 entities[event.MAC] = new_entity
                 add_entites([new_entity])
         
@@ -106,97 +208,149 @@ def setup_platform(hass, config, add_entites, discovery_info=None):
                 setStorage(hass, storage)
                 
             else:
-                entities[event.MAC]._data = data
-                # From https://github.com/kevinvincent/ha-wyzesense/issues/189
-                try:
-                    entities[event.MAC].schedule_update_ha_state()
-                except (AttributeError, AssertionError):
-                    _LOGGER.debug("wyze Sensor not yet ready for update")
+                state_hold.apply(event.MAC, data[ATTR_STATE], data)
 
     @retry(TimeoutError, tries=10, delay=1, logger=_LOGGER)
     def beginConn():
-        return Open(config[CONF_DEVICE], on_event)
+        clock_sync = ClockSync(config[CONF_CLOCK_SMOOTHING], config[CONF_CLOCK_CORRECTION])
+        return Open(config[CONF_DEVICE], on_event, clock_sync, config[CONF_PROCESS_ISOLATION], cached_capabilities)
 
+    usb_path = getUsbPath(config[CONF_DEVICE])
+    dongles = getDongleStorage(hass)
+    cached_capabilities = dongles.get(usb_path)
     ws = beginConn()
+    if ws.Capabilities is None:
+        _LOGGER.debug("Connected to hub, MAC and firmware version unknown")
+    else:
+        _LOGGER.debug("Connected to hub %s, firmware version %s" % (ws.Capabilities["mac"], ws.Capabilities["version"]))
+
+    def update_capabilities(capabilities):
+        if capabilities is None or capabilities == dongles.get(usb_path):
+            return
+        dongles[usb_path] = capabilities
+        setDongleStorage(hass, dongles)
+        for entity in entities.values():
+            entity._hub = capabilities
+            try:
+                entity.schedule_update_ha_state()
+            except (AttributeError, AssertionError):
+                _LOGGER.debug("wyze Sensor not yet ready for update")
+
+    update_capabilities(ws.Capabilities)
+
+    def add_stored_entities(macs):
+        new_entities = []
+        for mac in macs:
+            _LOGGER.debug("Registering Sensor Entity: %s" % mac)
+
+            mac = mac.strip()
+
+            if not len(mac) == 8:
+                _LOGGER.debug("Ignoring %s, Invalid length for MAC" % mac)
+                continue
+
+            initial_state = forced_initial_states.get(mac)
 
-    storage = getStorage(hass)
+            data = {
+                ATTR_AVAILABLE: False,
+                ATTR_MAC: mac,
+                ATTR_STATE: 0
+            }
 
-    _LOGGER.debug("%d Sensors Loaded from storage" % len(storage))
+            if not mac in entities:
+                new_entity = WyzeSensor(data, should_restore = True, override_restore_state = initial_state, hub = ws.Capabilities)
+                entities[mac] = new_entity
+                new_entities.append(new_entity)
 
-    for mac in storage:
-        _LOGGER.debug("Registering Sensor Entity: %s" % mac)
+        if new_entities:
+            add_entites(new_entities)
+        return [e.unique_id for e in new_entities]
 
-        mac = mac.strip()
+    def remove_entities(macs):
+        for mac in macs:
+            state_hold.cancel(mac)
+            toDelete = entities.pop(mac, None)
+            if toDelete:
+                hass.add_job(toDelete.async_remove)
 
-        if not len(mac) == 8:
-            _LOGGER.debug("Ignoring %s, Invalid length for MAC" % mac)
-            continue
+    def notify(notification):
+        hass.components.persistent_notification.create(notification, DOMAIN)
+        _LOGGER.debug(notification)
 
-        initial_state = forced_initial_states.get(mac)
+    storage = getStorage(hass)
 
-        data = {
-            ATTR_AVAILABLE: False,
-            ATTR_MAC: mac,
-            ATTR_STATE: 0
-        }
+    _LOGGER.debug("%d Sensors Loaded from storage" % len(storage))
 
-        if not mac in entities:
-            new_entity = WyzeSensor(data, should_restore = True, override_restore_state = initial_state)
-            entities[mac] = new_entity
-            add_entites([new_entity])
+    add_stored_entities(storage)
 
     # Configure Destructor
     def on_shutdown(event):
         _LOGGER.debug("Closing connection to hub")
+        state_hold.stop()
         ws.Stop()
 
     hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, on_shutdown)
 
+    sensors = SensorManager(ws, entities, lambda: getStorage(hass), lambda data: setStorage(hass, data),
+                            add_stored_entities, remove_entities, hass.config.config_dir)
+
     # Configure Service
     def on_scan(call):
         result = ws.Scan()
         if result:
-            notification = "Sensor found and added as: binary_sensor.wyzesense_%s (unless you have customized the entity ID prior).<br/>To add more sensors, call wyzesense.scan again.<br/><br/>More Info: type=%d, version=%d" % result
-            hass.components.persistent_notification.create(notification, DOMAIN)
-            _LOGGER.debug(notification)
+            notify("Sensor found and added as: binary_sensor.wyzesense_%s (unless you have customized the entity ID prior).<br/>To add more sensors, call wyzesense.scan again.<br/><br/>More Info: type=%d, version=%d" % result)
         else:
-            notification = "Scan completed with no sensor found."
-            hass.components.persistent_notification.create(notification, DOMAIN)
-            _LOGGER.debug(notification)
+            notify("Scan completed with no sensor found.")
 
     def on_remove(call):
-        mac = call.data.get(ATTR_MAC).upper()
-        if entities.get(mac):
-            ws.Delete(mac)
-            toDelete = entities[mac]
-            hass.add_job(toDelete.async_remove)
-            del entities[mac]
-
-            storage = getStorage(hass)
-            storage.remove(mac)
-            setStorage(hass, storage)
-
-            notification = "Successfully removed sensor: %s" % mac
-            hass.components.persistent_notification.create(notification, DOMAIN)
-            _LOGGER.debug(notification)
+        notify(sensors.remove(call.data.get(ATTR_MAC)))
+
+    def on_reconcile(call):
+        notify(sensors.reconcile())
+
+    def on_export(call):
+        notify(sensors.export(call.data.get(CONF_FILENAME)))
+
+    def on_import(call):
+        notify(sensors.restore(call.data.get(CONF_FILENAME)))
+
+    def on_trace(call):
+        if call.data.get(ATTR_ENABLED):
+            filename = hass.config.path(call.data.get(CONF_FILENAME))
+            ws.StartTrace(filename)
+            notify("Packet trace started, writing to %s" % filename)
         else:
-            notification = "No sensor with mac %s found to remove." % mac
-            hass.components.persistent_notification.create(notification, DOMAIN)
-            _LOGGER.debug(notification)
+            ws.StopTrace()
+            notify("Packet trace stopped.")
 
     hass.services.register(DOMAIN, SERVICE_SCAN, on_scan, SERVICE_SCAN_SCHEMA)
     hass.services.register(DOMAIN, SERVICE_REMOVE, on_remove, SERVICE_REMOVE_SCHEMA)
+    hass.services.register(DOMAIN, SERVICE_TRACE, on_trace, SERVICE_TRACE_SCHEMA)
+    hass.services.register(DOMAIN, SERVICE_RECONCILE, on_reconcile, SERVICE_RECONCILE_SCHEMA)
+    hass.services.register(DOMAIN, SERVICE_EXPORT, on_export, SERVICE_EXPORT_SCHEMA)
+    hass.services.register(DOMAIN, SERVICE_IMPORT, on_import, SERVICE_IMPORT_SCHEMA)
+
+    def refresh_capabilities():
+        try:
+            update_capabilities(ws.RefreshCapabilities())
+        except (OSError, EOFError) as e:
+            _LOGGER.warning("Could not refresh hub MAC and version: %r" % e)
+
+    if cached_capabilities is not None:
+        # The probe was skipped, check in the background that it's still the same dongle
+        hass.add_job(refresh_capabilities)
 
 
 class WyzeSensor(BinarySensorEntity, RestoreEntity):
     """Class to hold Hue Sensor basic info."""
 
-    def __init__(self, data, should_restore = False, override_restore_state = None):
+    def __init__(self, data, should_restore = False, override_restore_state = None, hub = None):
         """Initialize the sensor object."""
         _LOGGER.debug(data)
         self._data = data 
         self._should_restore = should_restore
         self._override_restore_state = override_restore_state
+        self._hub = hub
 
     async def async_added_to_hass(self):
         """Run when entity about to be added."""
@@ -247,5 +401,8 @@ class WyzeSensor(BinarySensorEntity, RestoreEntity):
         attributes = self._data.copy()
         del attributes[ATTR_STATE]
         del attributes[ATTR_AVAILABLE]
+        if self._hub:
+            attributes[ATTR_HUB_MAC] = self._hub["mac"]
+            attributes[ATTR_HUB_VERSION] = self._hub["version"]
 
         return attributes
@@ -0,0 +1,150 @@
+"""Batch remove, reconcile, export and import of the known sensors."""
+
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SensorManager(object):
+    """Batch operations on the sensor set behind the wyzesense services.
+
+    Each operation writes storage at most once and returns the text of a
+    single notification.
+    """
+
+    def __init__(self, ws, entities, get_storage, set_storage, add_entities, remove_entities, config_dir):
+        """entities is the MAC to entity dict owned by the platform.
+
+        add_entities(macs) creates entities for the given MACs and returns
+        the unique IDs of the ones it added. remove_entities(macs) removes
+        them again.
+        """
+        self._ws = ws
+        self._entities = entities
+        self._get_storage = get_storage
+        self._set_storage = set_storage
+        self._add_entities = add_entities
+        self._remove_entities = remove_entities
+        self._config_dir = os.path.realpath(config_dir)
+
+    def remove(self, macs):
+        # Keep the order given, but only ask the hub once per sensor
+        macs = list(dict.fromkeys(mac.strip().upper() for mac in macs if mac.strip()))
+        if not macs:
+            return "No sensors given to remove."
+
+        removed = []
+        missing = []
+        failed = []
+        for mac in macs:
+            if not self._entities.get(mac):
+                missing.append(mac)
+                continue
+            try:
+                self._ws.Delete(mac)
+            except (TimeoutError, AssertionError, OSError):
+                _LOGGER.exception("Failed to remove sensor %s from the hub" % mac)
+                failed.append(mac)
+                continue
+            removed.append(mac)
+
+        if removed:
+            self._remove_entities(removed)
+            self._set_storage([mac for mac in self._get_storage() if mac not in removed])
+
+        lines = []
+        if removed:
+            lines.append("Successfully removed sensors: %s" % ", ".join(removed))
+        if missing:
+            lines.append("No sensors found to remove for: %s" % ", ".join(missing))
+        if failed:
+            lines.append("Failed to remove sensors: %s" % ", ".join(failed))
+        return "<br/>".join(lines)
+
+    def reconcile(self):
+        try:
+            bound = self._ws.List()
+        except (TimeoutError, AssertionError, OSError) as e:
+            _LOGGER.exception("Failed to list sensors bound to the hub")
+            return "Reconcile failed, could not list sensors bound to the hub: %r" % e
+
+        storage = self._get_storage()
+        known = set(self._entities) | set(storage)
+        if not bound and known:
+            # More likely a fresh or misbehaving hub than every sensor unbound
+            return ("The hub reports no bound sensors, so none of the %d known sensors were removed. "
+                    "Use wyzesense.remove to remove them." % len(known))
+
+        added = self._add_entities([mac for mac in bound if mac not in self._entities])
+        stale = sorted(mac for mac in known if mac not in bound)
+        self._remove_entities(stale)
+        self._set_storage([mac for mac in storage if mac in bound] + [mac for mac in bound if mac not in storage])
+
+        return "Reconciled %d sensors bound to the hub.<br/>Added: %s<br/>Removed: %s" % (
+            len(bound), ", ".join(added) or "none", ", ".join(stale) or "none")
+
+    def export(self, filename):
+        path = self._path(filename)
+        if path is None:
+            return "Refusing to export outside the config directory: %s" % filename
+        if os.path.exists(path):
+            try:
+                self._read_export(path)
+            except (OSError, ValueError):
+                return "Refusing to overwrite %s, it is not a sensor export" % path
+
+        storage = self._get_storage()
+        try:
+            with open(path, 'w') as f:
+                json.dump(storage, f)
+        except OSError as e:
+            return "Could not write sensor export %s: %s" % (path, e)
+        return "Exported %d sensors to %s" % (len(storage), path)
+
+    def restore(self, filename):
+        path = self._path(filename)
+        if path is None:
+            return "Refusing to import from outside the config directory: %s" % filename
+        if not os.path.exists(path):
+            return "No sensor export found at %s" % path
+        try:
+            imported = self._read_export(path)
+        except (OSError, ValueError) as e:
+            return "Could not read sensor export %s: %s" % (path, e)
+
+        storage = self._get_storage()
+        new_macs = []
+        invalid = []
+        for mac in imported:
+            if not isinstance(mac, str) or len(mac.strip()) != 8:
+                invalid.append(repr(mac))
+                continue
+            mac = mac.strip().upper()
+            if mac not in storage and mac not in new_macs:
+                new_macs.append(mac)
+
+        if new_macs:
+            self._add_entities(new_macs)
+            self._set_storage(storage + new_macs)
+
+        notification = "Imported %d new sensors from %s" % (len(new_macs), path)
+        if invalid:
+            notification += "<br/>Ignored invalid entries: %s" % ", ".join(invalid)
+        return notification
+
+    def _path(self, filename):
+        """Resolves filename inside the config directory, None if it escapes it."""
+        path = os.path.realpath(os.path.join(self._config_dir, filename))
+        if os.path.commonpath([path, self._config_dir]) != self._config_dir:
+            return None
+        return path
+
+    @staticmethod
+    def _read_export(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError("expected a list of MAC addresses")
+        return data
@@ -0,0 +1,98 @@
+"""Per-sensor debounce, minimum on-time and off-delay."""
+
+import threading
+import time
+
+
+class StateHold(object):
+    """Delays sensor state changes according to per-sensor options.
+
+    Each sensor has at most one pending change, and a newer event replaces
+    it. All pending changes share a single timer set for the earliest
+    deadline. When it goes off, every change that is due is applied. So a
+    late or superseded timer can only ever apply what is pending at the time.
+    """
+
+    def __init__(self, options, get_state, commit, schedule, clock=time.monotonic):
+        """options maps a MAC to (debounce, min_on_time, off_delay) in seconds.
+
+        schedule(delay, action) must arrange for action() to run once after
+        delay seconds, replacing whatever was scheduled before. A delay of
+        None only cancels. It is called from the dongle thread, so it must
+        not block.
+        """
+        self._options = options
+        self._get_state = get_state
+        self._commit = commit
+        self._schedule = schedule
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Serializes schedule() calls so the last one reflects the latest state
+        self._timer_lock = threading.Lock()
+        self._timer = None
+        self._pending = {}
+        self._on_since = {}
+
+    def apply(self, mac, state, data):
+        options = self._options.get(mac)
+        if options is None:
+            self._commit(mac, data)
+            return
+
+        debounce, min_on_time, off_delay = options
+        with self._lock:
+            self._pending.pop(mac, None)
+            now = self._clock()
+            if bool(state) == bool(self._get_state(mac)):
+                # Any pending change was reverted before it took effect
+                deadline = now
+            elif state:
+                deadline = now + debounce
+            else:
+                deadline = max(now + debounce + off_delay, self._on_since.get(mac, now) + min_on_time)
+
+            if deadline <= now:
+                self._apply(mac, state, data, now)
+            else:
+                self._pending[mac] = (deadline, state, data)
+        self._reschedule()
+
+    def cancel(self, mac):
+        with self._lock:
+            self._pending.pop(mac, None)
+        self._reschedule()
+
+    def stop(self):
+        with self._lock:
+            self._pending.clear()
+        self._reschedule()
+
+    def _run(self, *args):
+        with self._timer_lock:
+            # The timer has gone off, so the next call must set a new one
+            self._timer = None
+        with self._lock:
+            now = self._clock()
+            for mac, (deadline, state, data) in list(self._pending.items()):
+                if deadline <= now:
+                    del self._pending[mac]
+                    self._apply(mac, state, data, now)
+        self._reschedule()
+
+    def _reschedule(self):
+        with self._timer_lock:
+            with self._lock:
+                deadline = min((p[0] for p in self._pending.values()), default=None)
+                now = self._clock()
+            if deadline == self._timer:
+                return
+            self._timer = deadline
+            if deadline is None:
+                self._schedule(None, None)
+            else:
+                self._schedule(max(deadline - now, 0), self._run)
+
+    def _apply(self, mac, state, data, now):
+        if state and not self._get_state(mac):
+            self._on_since[mac] = now
+        self._commit(mac, data)
@@ -10,8 +10,12 @@ import datetime
 import argparse
 import binascii
 import errno
+import math
+import multiprocessing
+import queue
 
 import logging
+import logging.handlers
 log = logging.getLogger(__name__)
 
 def bytes_to_hex(s):
@@ -29,6 +33,27 @@ TYPE_ASYNC  = 0x53
 def MAKE_CMD(type, cmd):
     return (type << 8) | cmd
 
+class ParseError(object):
+    """Result of Packet.Parse when s does not start with a valid frame."""
+    def __init__(self, reason, data):
+        self.Reason = reason
+        self.Data = data
+
+    def __str__(self):
+        return "%s: %s, data=%s" % (type(self).__name__, self.Reason, bytes_to_hex(self.Data))
+
+    def __bool__(self):
+        return False
+    __nonzero__ = __bool__
+
+class IncompleteFrame(ParseError):
+    """The frame header is valid so far but more bytes are needed."""
+    pass
+
+class InvalidFrame(ParseError):
+    """The frame is corrupt; the reader should resync past it."""
+    pass
+
 class Packet(object):
     _CMD_TIMEOUT = 5
 
@@ -89,7 +114,7 @@ class Packet(object):
     def Payload(self):
         return self._payload
 
-    def Send(self, fd):
+    def Encode(self):
         pkt = bytes()
         
         pkt += struct.pack(">HB", 0xAA55, self._cmd >> 8)
@@ -102,43 +127,52 @@ class Packet(object):
 
         checksum = checksum_from_bytes(pkt)
         pkt += struct.pack(">H", checksum)
-        log.debug("Sending: %s", bytes_to_hex(pkt))
+        return pkt
+
+    def Send(self, fd):
+        pkt = self.Encode()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Sending: %s", bytes_to_hex(pkt))
         ss = os.write(fd, pkt)
         assert ss == len(pkt)
+        return pkt
 
     @classmethod
     def Parse(cls, s):
+        """Decode the frame at the start of s.
+
+        Returns a Packet on success. On failure a ParseError is returned
+        instead of raised, so the reader can either wait for more data
+        (IncompleteFrame) or skip past a bad frame (InvalidFrame) without
+        losing the rest of its buffer.
+        """
         assert isinstance(s, bytes)
 
         if len(s) < 5:
-            log.error("Invalid packet: %s", bytes_to_hex(s))
-            log.error("Invalid packet length: %d", len(s))
-            return None
+            return IncompleteFrame("Packet too short: %d bytes" % len(s), s)
 
         magic, cmd_type, b2, cmd_id = struct.unpack_from(">HBBB", s)
         if magic != 0x55AA and magic != 0xAA55:
-            log.error("Invalid packet: %s", bytes_to_hex(s))
-            log.error("Invalid packet magic: %4X", magic)
-            return None
+            return InvalidFrame("Invalid packet magic: %04X" % magic, s[:5])
 
         cmd = MAKE_CMD(cmd_type, cmd_id)
         if cmd == cls.ASYNC_ACK:
-            assert len(s) >= 7
+            if len(s) < 7:
+                return IncompleteFrame("Truncated ACK packet", s)
             s = s[:7]
             payload = MAKE_CMD(cmd_type, b2)
+        elif b2 < 3:
+            return InvalidFrame("Invalid payload length: %d" % b2, s[:5])
         elif len(s) >= b2 + 4:
             s = s[: b2 + 4]
             payload = s[5:-2]
         else:
-            log.error("Invalid packet: %s", bytes_to_hex(s))
-            return None
+            return IncompleteFrame("Truncated packet, expected %d bytes" % (b2 + 4), s)
 
         cs_remote = (s[-2] << 8) | s[-1]
         cs_local = checksum_from_bytes(s[:-2])
         if cs_remote != cs_local:
-            log.error("Invalid packet: %s", bytes_to_hex(s))
-            log.error("Mismatched checksum, remote=%04X, local=%04X", cs_remote, cs_local)
-            return None
+            return InvalidFrame("Mismatched checksum, remote=%04X, local=%04X" % (cs_remote, cs_local), s)
 
         return cls(cmd, payload)
 
@@ -223,11 +257,12 @@ class Packet(object):
         return cls(cls.ASYNC_ACK, cmd)
 
 class SensorEvent(object):
-    def __init__(self, mac, timestamp, event_type, event_data):
+    def __init__(self, mac, timestamp, event_type, event_data, latency=None):
         self.MAC = mac
         self.Timestamp = timestamp
         self.Type = event_type
         self.Data = event_data
+        self.Latency = latency
     
     def __str__(self):
         s = "[%s][%s]" % (self.Timestamp.strftime("%Y-%m-%d %H:%M:%S"), self.MAC)
@@ -237,6 +272,190 @@ class SensorEvent(object):
             s += "RawEvent: type=%s, data=%s" % (self.Type, bytes_to_hex(self.Data))
         return s
 
+class ClockSync(object):
+    """Tracks the offset between the dongle clock and the host clock.
+
+    Every event carries a dongle timestamp, so host arrival time minus that
+    timestamp is the clock offset plus the delivery latency. Latency is never
+    negative, so the offset follows the smallest sample seen and only creeps
+    upwards by the smoothing factor, which keeps late buffered events from
+    dragging it along. A time sync resets the offset since the dongle clock
+    was just set from the host.
+
+    A step of the host clock, such as NTP setting it after boot on a device
+    without an RTC, would take that creep a long time to follow. Steps are
+    detected against the monotonic clock instead and applied to the offset
+    at once.
+
+    Until a time sync, or until _WARMUP samples have been seen, there is no
+    reference to measure against: timestamps are passed through unchanged
+    and no latency is reported. Otherwise the events a dongle flushes on
+    connect would define the offset and their delay would be hidden.
+    """
+    _WARMUP = 8
+    _STEP_THRESHOLD = 1.0
+
+    def __init__(self, smoothing=0.05, enabled=True, clock=time.time, monotonic=time.monotonic):
+        self.__lock = threading.Lock()
+        self.__smoothing = smoothing
+        self.__enabled = enabled
+        self.__clock = clock
+        self.__monotonic = monotonic
+        self.__epoch = None
+        self.__samples = []
+        self.Offset = None
+        self.Latency = None
+
+    def __reduce__(self):
+        # Only the settings travel to a child process, the estimate starts fresh
+        return (ClockSync, (self.__smoothing, self.__enabled))
+
+    def Reset(self):
+        with self.__lock:
+            self.Offset = 0.0
+            self.__samples = []
+            self.__epoch = self.__clock() - self.__monotonic()
+
+    def Update(self, dongle_ts):
+        """Returns the corrected timestamp and the delivery latency, in seconds.
+
+        The latency is None while there is no reference yet.
+        """
+        now = self.__clock()
+        epoch = now - self.__monotonic()
+        with self.__lock:
+            if self.__epoch is not None:
+                step = epoch - self.__epoch
+                if abs(step) > self._STEP_THRESHOLD:
+                    log.info("Host clock stepped by %.3fs", step)
+                    if self.Offset is not None:
+                        self.Offset += step
+                    self.__samples = [sample + step for sample in self.__samples]
+            self.__epoch = epoch
+
+            sample = now - dongle_ts
+            if self.Offset is None:
+                self.__samples.append(sample)
+                if len(self.__samples) < self._WARMUP:
+                    return dongle_ts, None
+                self.Offset = min(self.__samples)
+                self.__samples = []
+            elif sample < self.Offset:
+                self.Offset = sample
+            else:
+                self.Offset += self.__smoothing * (sample - self.Offset)
+
+            latency = sample - self.Offset
+            if self.Latency is None:
+                self.Latency = latency
+            else:
+                self.Latency += self.__smoothing * (latency - self.Latency)
+
+            if self.__enabled:
+                return dongle_ts + self.Offset, latency
+            return dongle_ts, latency
+
+class Framer(object):
+    """Splits the byte stream read from the dongle into packets.
+
+    An incomplete frame is kept until the rest of it arrives. The reports
+    making up one frame arrive back to back, so once no data has arrived for
+    _FRAME_TIMEOUT whatever is left of a frame is dropped, and the framer
+    resyncs on the next magic.
+    """
+    _MAGIC = b"\x55\xAA"
+    _FRAME_TIMEOUT = 0.2
+
+    def __init__(self, clock=time.monotonic):
+        self.__clock = clock
+        self.__buffer = b""
+        self.__last_data = clock()
+
+    def Feed(self, data):
+        """Returns a list of (packet, frame bytes) for every complete packet."""
+        now = self.__clock()
+        frames = []
+        if self.__buffer and now - self.__last_data >= self._FRAME_TIMEOUT:
+            # Flush the stale frame before new data can be mistaken for its tail
+            frames += self._Split(self.__buffer, True)[0]
+            self.__buffer = b""
+        if data:
+            self.__last_data = now
+            new_frames, self.__buffer = self._Split(self.__buffer + data, False)
+            frames += new_frames
+        return frames
+
+    def _Split(self, s, stale):
+        """Returns the packets found in s and the bytes left over."""
+        frames = []
+        debug = log.isEnabledFor(logging.DEBUG)
+        while True:
+            start = s.find(self._MAGIC)
+            if start == -1:
+                # Keep a trailing byte, it may be the first half of the magic
+                s = b"" if stale else s[-1:]
+                break
+
+            s = s[start:]
+            if debug:
+                log.debug("Trying to parse: %s", bytes_to_hex(s))
+            pkt = Packet.Parse(s)
+            if isinstance(pkt, IncompleteFrame):
+                if not stale:
+                    break
+                resync = s.find(self._MAGIC, 2)
+                pkt = InvalidFrame("Timed out waiting for the rest of the frame", s if resync == -1 else s[:resync])
+
+            if not pkt:
+                log.error("Invalid packet: %s", pkt)
+                s = s[2:]
+                continue
+
+            if debug:
+                log.debug("Received: %s", bytes_to_hex(s[:pkt.Length]))
+            frames.append((pkt, s[:pkt.Length]))
+            s = s[pkt.Length:]
+
+        return frames, s
+
+class PacketTrace(object):
+    """Compact binary log of raw frames.
+
+    Each record is a ">dBH" header (host time, direction, frame length)
+    followed by the frame bytes exactly as they went over the wire.
+    """
+    RX = 0
+    TX = 1
+
+    _HEADER = struct.Struct(">dBH")
+
+    def __init__(self, path):
+        self.__lock = threading.Lock()
+        self.__file = open(path, "ab")
+
+    def Write(self, direction, data):
+        record = self._HEADER.pack(time.time(), direction, len(data)) + data
+        with self.__lock:
+            if self.__file:
+                self.__file.write(record)
+
+    def Close(self):
+        with self.__lock:
+            f, self.__file = self.__file, None
+        if f:
+            f.close()
+
+    @classmethod
+    def Read(cls, path):
+        """Yields (timestamp, direction, frame) tuples from a trace file."""
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(cls._HEADER.size)
+                if len(header) < cls._HEADER.size:
+                    break
+                ts, direction, length = cls._HEADER.unpack(header)
+                yield ts, direction, f.read(length)
+
 class Dongle(object):
     _CMD_TIMEOUT = 5
 
@@ -251,7 +470,8 @@ class Dongle(object):
             return
 
         timestamp, event_type, sensor_mac = struct.unpack_from(">QB8s", pkt.Payload)
-        timestamp = datetime.datetime.fromtimestamp(timestamp/1000.0)
+        timestamp, latency = self.__clock.Update(timestamp/1000.0)
+        timestamp = datetime.datetime.fromtimestamp(timestamp)
         sensor_mac = sensor_mac.decode('ascii')
         alarm_data = pkt.Payload[17:]
         if event_type == 0xA2:
@@ -265,14 +485,15 @@ class Dongle(object):
                 log.info("Unknown Sensor Type: %x", alarm_data[0])
                 sensor_type = "unknown"
                 sensor_state = "unknown"
-            e = SensorEvent(sensor_mac, timestamp, "state", (sensor_type, sensor_state, alarm_data[2], alarm_data[8]))
+            e = SensorEvent(sensor_mac, timestamp, "state", (sensor_type, sensor_state, alarm_data[2], alarm_data[8]), latency)
         else:
-            e = SensorEvent(sensor_mac, timestamp, "raw_%02X" % event_type, alarm_data)
+            e = SensorEvent(sensor_mac, timestamp, "raw_%02X" % event_type, alarm_data, latency)
 
         self.__on_event(self, e)
 
     def _OnSyncTime(self, pkt):
         self._SendPacket(Packet.SyncTimeAck())
+        self.__clock.Reset()
 
     def _OnEventLog(self, pkt):
         assert len(pkt.Payload) >= 9
@@ -282,14 +503,19 @@ class Dongle(object):
         msg = pkt.Payload[9:]
         log.info("LOG: time=%s, data=%s", tm.isoformat(), bytes_to_hex(msg))
 
-    def __init__(self, device, event_handler):
+    def __init__(self, device, event_handler, clock_sync=None, capabilities=None):
         self.__lock = threading.Lock()
+        self.__clock = clock_sync or ClockSync()
+        # Dongle MAC, firmware version and ENR. Passing in what an earlier
+        # connection to the same device found skips the probe.
+        self.Capabilities = capabilities
         self.__device = device
         self.__fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
         self.__sensors = {}
         self.__exit_event = threading.Event()
         self.__thread = threading.Thread(target = self._Worker)
         self.__on_event = event_handler
+        self.__trace = None
 
         self.__handlers = {
             Packet.NOTIFY_SYNC_TIME: self._OnSyncTime,
@@ -330,14 +556,17 @@ class Dongle(object):
         return oldHandler
 
     def _SendPacket(self, pkt):
-        log.debug("===> Sending: %s", str(pkt))
-        pkt.Send(self.__fd)
+        log.debug("===> Sending: %s", pkt)
+        data = pkt.Send(self.__fd)
+        trace = self.__trace
+        if trace:
+            trace.Write(PacketTrace.TX, data)
 
     def _DefaultHandler(self, pkt):
         pass
 
     def _HandlePacket(self, pkt):
-        log.debug("<=== Received: %s", str(pkt))
+        log.debug("<=== Received: %s", pkt)
         with self.__lock:
             handler = self.__handlers.get(pkt.Cmd, self._DefaultHandler)
         
@@ -347,31 +576,24 @@ class Dongle(object):
         handler(pkt)
 
     def _Worker(self):
-        while True: #Watchdog
+        # The framer lives outside the watchdog loop so that an error doesn't
+        # throw away frames that are already queued in its buffer.
+        framer = Framer()
+        while not self.__exit_event.is_set(): #Watchdog
             try:
-                s = b""
-                while True:
-                    if self.__exit_event.isSet():
-                        break
-                    
-                    s += self._ReadRawHID()
-                    #if s:
-                    #    log.info("Incoming buffer: %s", bytes_to_hex(s))
-                    start = s.find(b"\x55\xAA")
-                    if start == -1:
+                while not self.__exit_event.is_set():
+                    data = self._ReadRawHID()
+                    for pkt, frame in framer.Feed(data):
+                        trace = self.__trace
+                        if trace:
+                            trace.Write(PacketTrace.RX, frame)
+                        try:
+                            self._HandlePacket(pkt)
+                        except:
+                            log.exception("Ignoring error while handling %s. Please share the error logs with the developers.", pkt)
+
+                    if not data:
                         time.sleep(0.1)
-                        continue
-
-                    s = s[start:]
-                    log.debug("Trying to parse: %s", bytes_to_hex(s))
-                    pkt = Packet.Parse(s)
-                    if not pkt:
-                        s = s[2:]
-                        continue
-
-                    log.debug("Received: %s", bytes_to_hex(s[:pkt.Length]))
-                    s = s[pkt.Length:]
-                    self._HandlePacket(pkt)
             except OSError as e:
                 log.error(e)
                 break
@@ -388,6 +610,30 @@ class Dongle(object):
         if not result:
             raise TimeoutError("_DoCommand")
 
+    def _DoPipeline(self, pkts, timeout=_CMD_TIMEOUT):
+        """Sends all commands up front, then waits for all of their responses."""
+        ctx = self.CmdContext(evt=threading.Event(), results={})
+
+        def make_handler(cmd):
+            def cmd_handler(pkt):
+                ctx.results[cmd] = pkt
+                if len(ctx.results) == len(pkts):
+                    ctx.evt.set()
+            return cmd_handler
+
+        oldHandlers = [self._SetHandler(pkt.Cmd + 1, make_handler(pkt.Cmd)) for pkt in pkts]
+        try:
+            for pkt in pkts:
+                self._SendPacket(pkt)
+            result = ctx.evt.wait(timeout)
+        finally:
+            for pkt, oldHandler in zip(pkts, oldHandlers):
+                self._SetHandler(pkt.Cmd + 1, oldHandler)
+
+        if not result:
+            raise TimeoutError("_DoPipeline")
+        return [ctx.results[pkt.Cmd] for pkt in pkts]
+
     def _DoSimpleCommand(self, pkt, timeout=_CMD_TIMEOUT):
         ctx = self.CmdContext(result = None)
 
@@ -441,6 +687,21 @@ class Dongle(object):
         log.debug("GetVersion returns %s", version)
         return version
 
+    def _ProbeCapabilities(self):
+        log.debug("Start ProbeCapabilities...")
+        r_string = bytes(struct.pack("<LLLL", *([0x30303030] * 4)))
+        enr, mac, version = self._DoPipeline([Packet.GetEnr(r_string), Packet.GetMAC(), Packet.GetVersion()])
+
+        assert len(enr.Payload) == 16
+        assert len(mac.Payload) == 8
+        caps = {
+            "enr": bytes_to_hex(enr.Payload).decode('ascii'),
+            "mac": mac.Payload.decode('ascii', errors='replace'),
+            "version": version.Payload.decode('ascii', errors='replace'),
+        }
+        log.debug("ProbeCapabilities returns mac=%s, version=%s", caps["mac"], caps["version"])
+        return caps
+
     def _GetSensorR1(self, mac, r1):
         log.debug("Start GetSensorR1...")
         resp = self._DoSimpleCommand(Packet.GetSensorR1(mac, r1))
@@ -495,19 +756,51 @@ class Dongle(object):
 
         try:
             self._Inquiry()
-
-            # self.ENR = self._GetEnr([0x30303030] * 4)
-            # self.MAC = self._GetMac()
-            # log.debug("Dongle MAC is [%s]", self.MAC)
-
-            # self.Version = self._GetVersion()
-            # log.debug("Dongle version: %s", self.Version)
-
             self._FinishAuth()
+            if self.Capabilities is None:
+                self.RefreshCapabilities()
+            if self.Capabilities is not None:
+                log.debug("Dongle MAC is [%s], version: %s", self.Capabilities["mac"], self.Capabilities["version"])
         except:
             self.Stop()
             raise
 
+    @property
+    def ClockOffset(self):
+        """Smoothed host minus dongle clock offset in seconds, None until known."""
+        return self.__clock.Offset
+
+    @property
+    def Latency(self):
+        """Smoothed event delivery latency in seconds, None until known."""
+        return self.__clock.Latency
+
+    def RefreshCapabilities(self):
+        """Probes the dongle again and returns its capabilities.
+
+        Capabilities are only metadata, so if the dongle doesn't answer this
+        logs a warning and keeps what was known before.
+        """
+        try:
+            self.Capabilities = self._ProbeCapabilities()
+        except (TimeoutError, AssertionError) as e:
+            log.warning("Could not read dongle MAC and version: %r", e)
+        return self.Capabilities
+
+    def StartTrace(self, path):
+        """Appends every frame sent or received to a binary trace file."""
+        trace = PacketTrace(path)
+        old_trace, self.__trace = self.__trace, trace
+        if old_trace:
+            old_trace.Close()
+        log.info("Packet trace started: %s", path)
+
+    def StopTrace(self):
+        trace, self.__trace = self.__trace, None
+        if trace:
+            trace.Close()
+            log.info("Packet trace stopped")
+
     def List(self):
         sensors = self._GetSensors()
         for x in sensors:
@@ -516,6 +809,7 @@ class Dongle(object):
         return sensors
 
     def Stop(self, timeout=_CMD_TIMEOUT):
+        self.StopTrace()
         self.__exit_event.set()
         os.close(self.__fd)
         self.__fd = None
@@ -562,5 +856,283 @@ class Dongle(object):
         log.debug("CmdDelSensor: %s deleted", mac)
 
 
-def Open(device, event_handler):
-    return Dongle(device, event_handler)
+class _EventRecord(object):
+    """Fixed-size binary encoding of a SensorEvent for the process pipe.
+
+    Layout: MAC, timestamp, event latency, dongle clock offset and smoothed
+    latency, raw event type, data length and up to 64 bytes of data. State
+    events keep their decoded fields as four bytes of data. Clock values that
+    are not known yet travel as NaN.
+    """
+    _RECORD = struct.Struct(">8sddddBB64s")
+    _STATE_EVENT = 0xA2
+    _SENSOR_TYPES = ["unknown", "switch", "motion"]
+    _SENSOR_STATES = ["unknown", "open", "close", "active", "inactive"]
+
+    Size = _RECORD.size
+
+    @classmethod
+    def Pack(cls, ws, e):
+        if e.Type == 'state':
+            sensor_type, sensor_state, battery, signal = e.Data
+            event_type = cls._STATE_EVENT
+            data = struct.pack("BBBB", cls._SENSOR_TYPES.index(sensor_type),
+                               cls._SENSOR_STATES.index(sensor_state), battery, signal)
+        else:
+            event_type = int(e.Type[4:], 16)
+            data = bytes(e.Data[:64])
+
+        return cls._RECORD.pack(e.MAC.encode('ascii'), e.Timestamp.timestamp(),
+                                cls._ToFloat(e.Latency), cls._ToFloat(ws.ClockOffset), cls._ToFloat(ws.Latency),
+                                event_type, len(data), data)
+
+    @classmethod
+    def Unpack(cls, record):
+        """Returns the SensorEvent, the clock offset and the smoothed latency."""
+        mac, ts, latency, offset, avg_latency, event_type, data_len, data = cls._RECORD.unpack(record)
+        mac = mac.decode('ascii')
+        timestamp = datetime.datetime.fromtimestamp(ts)
+        data = data[:data_len]
+        if event_type == cls._STATE_EVENT:
+            e = SensorEvent(mac, timestamp, "state",
+                            (cls._SENSOR_TYPES[data[0]], cls._SENSOR_STATES[data[1]], data[2], data[3]),
+                            cls._FromFloat(latency))
+        else:
+            e = SensorEvent(mac, timestamp, "raw_%02X" % event_type, data, cls._FromFloat(latency))
+        return e, cls._FromFloat(offset), cls._FromFloat(avg_latency)
+
+    @staticmethod
+    def _ToFloat(value):
+        return float("nan") if value is None else value
+
+    @staticmethod
+    def _FromFloat(value):
+        return None if math.isnan(value) else value
+
+class _LogForwarder(logging.Handler):
+    """Re-dispatches log records from the driver process to the local loggers."""
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+def _RemoteMain(device, clock_sync, capabilities, event_conn, cmd_conn, log_queue, log_level):
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(log_level)
+
+    # The reader thread only queues records, so a parent that is slow to
+    # drain the pipe can't hold up HID reads and ACKs.
+    records = queue.Queue()
+
+    def on_event(ws, e):
+        records.put(_EventRecord.Pack(ws, e))
+
+    def sender():
+        while True:
+            record = records.get()
+            if record is None:
+                break
+            try:
+                event_conn.send_bytes(record)
+            except OSError:
+                # Parent went away
+                break
+
+    sender_thread = threading.Thread(target = sender)
+    sender_thread.daemon = True
+    sender_thread.start()
+
+    try:
+        ws = Dongle(device, on_event, clock_sync, capabilities)
+    except Exception as e:
+        cmd_conn.send((False, e))
+        return
+    cmd_conn.send((True, ws.Capabilities))
+
+    stopping = False
+    try:
+        while True:
+            try:
+                name, args = cmd_conn.recv()
+            except EOFError:
+                # Parent went away
+                break
+
+            if name == "Stop":
+                stopping = True
+                break
+            elif name not in RemoteDongle.COMMANDS:
+                cmd_conn.send((False, ValueError("Unknown command: %s" % name)))
+                continue
+
+            try:
+                cmd_conn.send((True, getattr(ws, name)(*args)))
+            except Exception as e:
+                cmd_conn.send((False, e))
+    finally:
+        ws.Stop()
+        records.put(None)
+        sender_thread.join()
+        event_conn.close()
+
+    if stopping:
+        cmd_conn.send((True, None))
+
+class RemoteDongle(object):
+    """Runs a Dongle in a child process.
+
+    HID reads and ACKs happen in the child so they don't compete with the
+    host process for the GIL. Events come back as fixed-size records over a
+    pipe and commands are forwarded over a second pipe. If the child exits
+    unexpectedly it is restarted, backing off up to _MAX_RESPAWN_DELAY.
+
+    The child's log level is taken from this module's logger when the child
+    is started; later changes only apply after a restart.
+    """
+    COMMANDS = ("List", "Scan", "Delete", "RefreshCapabilities", "StartTrace", "StopTrace")
+
+    _RESPAWN_DELAY = 1
+    _MAX_RESPAWN_DELAY = 60
+
+    def __init__(self, device, event_handler, clock_sync=None, capabilities=None):
+        self.__ctx = multiprocessing.get_context("spawn")
+        self.__device = device
+        self.__clock_sync = clock_sync or ClockSync()
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__on_event = event_handler
+        self.__clock_offset = None
+        self.__latency = None
+        # Kept across restarts of the driver process so they skip the probe
+        self.Capabilities = capabilities
+
+        self.__log_queue = self.__ctx.Queue()
+        self.__log_listener = logging.handlers.QueueListener(self.__log_queue, _LogForwarder())
+        self.__log_listener.start()
+
+        try:
+            self._Spawn()
+        except:
+            self.__log_listener.stop()
+            raise
+
+        self.__thread = threading.Thread(target = self._Worker)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def _Spawn(self):
+        self.__events, event_conn = self.__ctx.Pipe(duplex=False)
+        self.__cmd, cmd_conn = self.__ctx.Pipe()
+        self.__process = self.__ctx.Process(
+            target = _RemoteMain,
+            args = (self.__device, self.__clock_sync, self.Capabilities,
+                    event_conn, cmd_conn, self.__log_queue, log.getEffectiveLevel()),
+            daemon = True)
+        self.__process.start()
+        event_conn.close()
+        cmd_conn.close()
+
+        try:
+            self.Capabilities = self._Reply()
+        except:
+            self._Reap()
+            raise
+
+    def _Reap(self, timeout=Dongle._CMD_TIMEOUT):
+        self.__process.join(timeout)
+        if self.__process.is_alive():
+            self.__process.terminate()
+            self.__process.join(timeout)
+        self.__cmd.close()
+        self.__events.close()
+
+    def _Respawn(self):
+        delay = self._RESPAWN_DELAY
+        while not self.__stopping.wait(delay):
+            with self.__lock:
+                self._Reap(0)
+                try:
+                    self._Spawn()
+                    log.info("Driver process restarted")
+                    return True
+                except Exception:
+                    log.exception("Failed to restart the driver process, retrying in %d seconds", delay)
+            delay = min(delay * 2, self._MAX_RESPAWN_DELAY)
+        return False
+
+    def _Worker(self):
+        while True:
+            try:
+                record = self.__events.recv_bytes()
+            except (EOFError, OSError):
+                if self.__stopping.is_set():
+                    break
+                self.__process.join(1)
+                log.error("Driver process exited unexpectedly with code %s, restarting it", self.__process.exitcode)
+                if not self._Respawn():
+                    break
+                continue
+
+            try:
+                e, self.__clock_offset, self.__latency = _EventRecord.Unpack(record)
+                self.__on_event(self, e)
+            except:
+                log.exception("Ignoring error while dispatching event from the driver process.")
+
+    def _Reply(self):
+        try:
+            ok, result = self.__cmd.recv()
+        except EOFError:
+            raise OSError("Driver process exited unexpectedly")
+        if not ok:
+            raise result
+        return result
+
+    def _Call(self, name, *args):
+        with self.__lock:
+            self.__cmd.send((name, args))
+            return self._Reply()
+
+    @property
+    def ClockOffset(self):
+        return self.__clock_offset
+
+    @property
+    def Latency(self):
+        return self.__latency
+
+    def List(self):
+        return self._Call("List")
+
+    def Scan(self, timeout=60):
+        return self._Call("Scan", timeout)
+
+    def Delete(self, mac):
+        return self._Call("Delete", mac)
+
+    def RefreshCapabilities(self):
+        # Kept here too, so a restarted driver gets the refreshed ones
+        self.Capabilities = self._Call("RefreshCapabilities")
+        return self.Capabilities
+
+    def StartTrace(self, path):
+        return self._Call("StartTrace", path)
+
+    def StopTrace(self):
+        return self._Call("StopTrace")
+
+    def Stop(self, timeout=Dongle._CMD_TIMEOUT):
+        self.__stopping.set()
+        try:
+            self._Call("Stop")
+        except (OSError, EOFError):
+            pass
+        with self.__lock:
+            self._Reap(timeout)
+        self.__thread.join(timeout)
+        self.__log_listener.stop()
+
+
+def Open(device, event_handler, clock_sync=None, isolated=False, capabilities=None):
+    if isolated:
+        return RemoteDongle(device, event_handler, clock_sync, capabilities)
+    return Dongle(device, event_handler, clock_sync, capabilities)
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+from hypothesis import settings
+
+# Run a longer fuzzing session with: pytest --hypothesis-profile=fuzz
+settings.register_profile("fuzz", max_examples=5000)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_dongle import FakeDongle
+
+
+@pytest.fixture
+def fake_dongle():
+    dongle = FakeDongle()
+    yield dongle
+    dongle.Close()
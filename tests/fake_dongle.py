@@ -0,0 +1,140 @@
+"""A pty-backed stand-in for the Wyze Sense hub, so the driver can run without hardware."""
+
+import fcntl
+import os
+import pty
+import struct
+import termios
+import threading
+import time
+import tty
+
+from custom_components.wyzesense.wyzesense_custom import Packet, checksum_from_bytes
+
+MAC = "ABCDEF01"
+VERSION = "0.0.0.30"
+
+
+def frame(cmd, payload=b""):
+    """Encodes a packet the way the dongle sends it (55AA magic)."""
+    pkt = struct.pack(">HBBB", 0x55AA, cmd >> 8, len(payload) + 3, cmd & 0xFF) + payload
+    return pkt + struct.pack(">H", checksum_from_bytes(pkt))
+
+
+def alarm(mac, state, timestamp=None, sensor_type=0x02):
+    """Encodes a sensor state notification."""
+    if timestamp is None:
+        timestamp = int(time.time() * 1000)
+    data = bytes([sensor_type, 0, 95, 0, 0, state, 0, 0, 40])
+    payload = struct.pack(">QB8s", timestamp, 0xA2, mac.encode("ascii")) + data
+    return frame(Packet.NOTIFY_SENSOR_ALARM, payload)
+
+
+class Events(object):
+    """Event handler that records events and lets tests wait for them."""
+
+    def __init__(self):
+        self.events = []
+        self.cond = threading.Condition()
+
+    def __call__(self, ws, e):
+        with self.cond:
+            self.events.append(e)
+            self.cond.notify_all()
+
+    def wait(self, predicate, timeout=5):
+        with self.cond:
+            return self.cond.wait_for(lambda: predicate(self.events), timeout)
+
+    def states(self, macs):
+        return [(e.MAC, e.Data[1]) for e in self.events if e.Type == "state" and e.MAC in macs]
+
+
+class FakeDongle(object):
+    """Answers the driver's commands and lets tests inject raw bytes.
+
+    Bytes are delivered as HID reports of at most 63 bytes. A report is only
+    written once the driver has read the previous one, since a pty doesn't
+    keep report boundaries the way hidraw does.
+    """
+
+    def __init__(self, responses=None, sensors=()):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        self.received = []
+        self.responses = {
+            Packet.CMD_INQUIRY: [b"\x01"],
+            Packet.CMD_FINISH_AUTH: [b""],
+            Packet.CMD_GET_ENR: [b"0" * 16],
+            Packet.CMD_GET_MAC: [MAC.encode("ascii")],
+            Packet.CMD_GET_DONGLE_VERSION: [VERSION.encode("ascii")],
+            Packet.CMD_GET_SENSOR_COUNT: [bytes([len(sensors)])],
+            Packet.CMD_GET_SENSOR_LIST: [mac.encode("ascii") for mac in sensors],
+        }
+        if responses is not None:
+            self.responses.update(responses)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._Reader)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _Pending(self):
+        buf = fcntl.ioctl(self.slave, termios.FIONREAD, b"\0\0\0\0")
+        return struct.unpack("i", buf)[0]
+
+    def Write(self, data, timeout=5):
+        """Delivers data to the driver as a sequence of HID reports."""
+        with self._lock:
+            for i in range(0, len(data), 0x3F):
+                chunk = data[i:i + 0x3F]
+                os.write(self.master, bytes([len(chunk)]) + chunk)
+                # The pty hands data over asynchronously, so first wait for the
+                # report to show up (unless it was read already), then for the
+                # driver to consume it.
+                deadline = time.time() + 0.05
+                while not self._Pending() and time.time() < deadline:
+                    time.sleep(0.001)
+                deadline = time.time() + timeout
+                while self._Pending() and time.time() < deadline:
+                    time.sleep(0.001)
+
+    def _Reader(self):
+        buf = b""
+        while not self._closed:
+            try:
+                buf += os.read(self.master, 256)
+            except OSError:
+                return
+
+            while True:
+                start = buf.find(b"\xAA\x55")
+                if start == -1:
+                    buf = buf[-1:]
+                    break
+                buf = buf[start:]
+                pkt = Packet.Parse(b"\x55\xAA" + buf[2:])
+                if not pkt:
+                    break
+                buf = buf[pkt.Length:]
+                self.received.append(pkt)
+                self._Respond(pkt)
+
+    def wait_received(self, predicate, timeout=5):
+        """Waits until a packet the driver sent matches predicate."""
+        deadline = time.time() + timeout
+        while not any(predicate(pkt) for pkt in list(self.received)):
+            if time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _Respond(self, pkt):
+        for payload in self.responses.get(pkt.Cmd, ()):
+            self.Write(frame(pkt.Cmd + 1, payload))
+
+    def Close(self):
+        self._closed = True
+        os.close(self.master)
+        os.close(self.slave)
@@ -0,0 +1,24 @@
+"""Hypothesis strategies for dongle frames and line noise."""
+
+from hypothesis import strategies as st
+
+from fake_dongle import frame
+
+commands = st.builds(
+    lambda t, c: (t << 8) | c,
+    st.sampled_from([0x43, 0x53]),
+    st.integers(min_value=0, max_value=0xFE))
+payloads = st.binary(max_size=80)
+frames = st.builds(frame, commands, payloads)
+
+noise = st.one_of(
+    # Random bytes
+    st.binary(min_size=1, max_size=40),
+    # A frame with a corrupted byte
+    st.builds(lambda f, i, v: f[:2 + i % (len(f) - 2)] + bytes([v]) + f[3 + i % (len(f) - 2):],
+              frames, st.integers(min_value=0), st.integers(min_value=0, max_value=0xFF)),
+    # A truncated frame
+    st.builds(lambda f, i: f[:i % len(f)], frames, st.integers(min_value=0)),
+    # A header with a corrupted length byte
+    st.builds(lambda b2: b"\x55\xAA\x53" + bytes([b2]) + b"\x19", st.integers(min_value=0, max_value=0xFF)),
+)
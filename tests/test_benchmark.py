@@ -0,0 +1,65 @@
+"""Parse throughput and resync cost, tracked with pytest-benchmark.
+
+Compare runs with: pytest tests/test_benchmark.py --benchmark-autosave --benchmark-compare
+"""
+
+from custom_components.wyzesense.wyzesense_custom import Framer, Packet
+
+from fake_dongle import alarm, frame
+
+ALARM = alarm("777A4656", 1, timestamp=0)
+STREAM = ALARM * 100
+# Frames with a bad checksum, each of which costs a failed parse and a resync
+NOISY_STREAM = (ALARM[:-1] + b"\x00") * 100 + ALARM
+# Headers whose length byte claims more data than will ever arrive
+STALLED_STREAM = b"\x55\xAA\x53\xF0\x19" * 100 + ALARM
+
+
+class Clock(object):
+    now = 0.0
+
+    def __call__(self):
+        # Every call moves past the frame timeout
+        self.now += 1
+        return self.now
+
+
+def parse_stream(stream):
+    framer = Framer(Clock())
+    # The second, empty read comes after the line has gone quiet
+    return framer.Feed(stream) + framer.Feed(b"")
+
+
+def test_parse(benchmark):
+    pkt = benchmark(Packet.Parse, ALARM)
+    assert pkt.Cmd == Packet.NOTIFY_SENSOR_ALARM
+
+
+def test_parse_large_payload(benchmark):
+    data = frame(Packet.NOTIFY_EVENT_LOG, bytes(250))
+    assert benchmark(Packet.Parse, data)
+
+
+def test_framer_throughput(benchmark):
+    frames = benchmark(parse_stream, STREAM)
+    assert len(frames) == 100
+
+
+def test_framer_split_reports(benchmark):
+    reports = [STREAM[i:i + 0x3F] for i in range(0, len(STREAM), 0x3F)]
+
+    def feed():
+        framer = Framer()
+        return sum(len(framer.Feed(r)) for r in reports)
+
+    assert benchmark(feed) == 100
+
+
+def test_resync_bad_checksum(benchmark):
+    frames = benchmark(parse_stream, NOISY_STREAM)
+    assert len(frames) == 1
+
+
+def test_resync_stalled_frames(benchmark):
+    frames = benchmark(parse_stream, STALLED_STREAM)
+    assert len(frames) == 1
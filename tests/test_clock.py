@@ -0,0 +1,108 @@
+import pickle
+
+import pytest
+
+from custom_components.wyzesense.wyzesense_custom import ClockSync
+
+
+class FakeClock(object):
+    """Wall clock that only moves when the test steps it."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def monotonic(self):
+        return 0.0
+
+
+def test_no_correction_before_reference():
+    clock = FakeClock()
+    sync = ClockSync(clock=clock, monotonic=clock.monotonic)
+    # A buffered event flushed on connect keeps its own timestamp
+    assert sync.Update(clock.now - 30) == (clock.now - 30, None)
+    assert sync.Offset is None
+    assert sync.Latency is None
+
+
+def test_warmup_takes_smallest_sample():
+    clock = FakeClock()
+    sync = ClockSync(clock=clock, monotonic=clock.monotonic)
+    delays = [30, 5, 0.2, 0.5, 1, 0.3, 2, 0.4]
+    for delay in delays:
+        ts, latency = sync.Update(clock.now - 10 - delay)
+    assert sync.Offset == pytest.approx(10.2)
+    assert latency == pytest.approx(0.2)
+    assert ts == pytest.approx(clock.now - 0.2)
+
+
+def test_reset_establishes_reference():
+    clock = FakeClock()
+    sync = ClockSync(clock=clock, monotonic=clock.monotonic)
+    sync.Reset()
+    ts, latency = sync.Update(clock.now - 3)
+    # The offset only creeps towards a later sample
+    assert sync.Offset == pytest.approx(0.05 * 3)
+    assert latency == pytest.approx(3 - 0.05 * 3)
+    assert ts == pytest.approx(clock.now - latency)
+
+
+def test_late_events_do_not_drag_offset():
+    clock = FakeClock()
+    sync = ClockSync(smoothing=0.05, clock=clock, monotonic=clock.monotonic)
+    sync.Reset()
+    sync.Update(clock.now - 60)
+    assert sync.Offset == pytest.approx(3)
+    assert sync.Latency == pytest.approx(57)
+
+
+def test_host_jump_back_is_followed():
+    clock = FakeClock()
+    sync = ClockSync(clock=clock, monotonic=clock.monotonic)
+    sync.Reset()
+    clock.now -= 100
+    ts, latency = sync.Update(clock.now + 100)
+    assert sync.Offset == -100
+    assert latency == 0
+    assert ts == clock.now
+
+
+def test_host_jump_forward_is_followed():
+    clock = FakeClock()
+    sync = ClockSync(clock=clock, monotonic=clock.monotonic)
+    sync.Reset()
+    clock.now += 3600
+    ts, latency = sync.Update(clock.now - 3600)
+    assert sync.Offset == 3600
+    assert latency == 0
+    assert ts == clock.now
+
+
+def test_host_jump_during_warmup_is_followed():
+    clock = FakeClock()
+    sync = ClockSync(clock=clock, monotonic=clock.monotonic)
+    for _ in range(ClockSync._WARMUP - 1):
+        sync.Update(clock.now - 10)
+    clock.now += 3600
+    ts, latency = sync.Update(clock.now - 3600 - 10)
+    assert sync.Offset == 3610
+    assert latency == 0
+
+
+def test_disabled_reports_latency_only():
+    clock = FakeClock()
+    sync = ClockSync(smoothing=0, enabled=False, clock=clock, monotonic=clock.monotonic)
+    sync.Reset()
+    assert sync.Update(clock.now - 2) == (clock.now - 2, 2)
+
+
+def test_pickle_keeps_settings_only():
+    sync = ClockSync(smoothing=0.5, enabled=False)
+    sync.Reset()
+    copy = pickle.loads(pickle.dumps(sync))
+    assert copy.Offset is None
+    copy.Reset()
+    ts, latency = copy.Update(100.0)
+    assert ts == 100.0
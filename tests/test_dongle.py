@@ -0,0 +1,120 @@
+import time
+
+from hypothesis import HealthCheck, given, settings, strategies as st
+
+from custom_components.wyzesense.wyzesense_custom import Open, Packet
+
+from fake_dongle import Events, FakeDongle, MAC, VERSION, alarm, frame
+from strategies import noise
+
+
+def test_open_and_list(fake_dongle):
+    fake_dongle.responses[Packet.CMD_GET_SENSOR_COUNT] = [b"\x02"]
+    fake_dongle.responses[Packet.CMD_GET_SENSOR_LIST] = [b"777A4656", b"77793176"]
+    ws = Open(fake_dongle.device, Events())
+    try:
+        assert ws.Capabilities["mac"] == MAC
+        assert ws.Capabilities["version"] == VERSION
+        assert ws.List() == ["777A4656", "77793176"]
+    finally:
+        ws.Stop()
+
+
+def test_open_without_capabilities(fake_dongle):
+    fake_dongle.responses[Packet.CMD_GET_DONGLE_VERSION] = []
+    ws = Open(fake_dongle.device, Events())
+    try:
+        assert ws.Capabilities is None
+        assert ws.List() == []
+    finally:
+        ws.Stop()
+
+
+def test_known_capabilities_skip_probe(fake_dongle):
+    capabilities = {"enr": "30" * 16, "mac": MAC, "version": VERSION}
+    ws = Open(fake_dongle.device, Events(), capabilities=capabilities)
+    try:
+        assert ws.Capabilities == capabilities
+        assert not any(p.Cmd == Packet.CMD_GET_MAC for p in fake_dongle.received)
+    finally:
+        ws.Stop()
+
+
+def test_refresh_replaces_stale_capabilities(fake_dongle):
+    stale = {"enr": "30" * 16, "mac": "00000000", "version": "0.0.0.1"}
+    ws = Open(fake_dongle.device, Events(), capabilities=stale)
+    try:
+        assert ws.Capabilities == stale
+        assert ws.RefreshCapabilities()["mac"] == MAC
+        assert ws.Capabilities["version"] == VERSION
+    finally:
+        ws.Stop()
+
+
+def test_undecodable_capabilities(fake_dongle):
+    fake_dongle.responses[Packet.CMD_GET_DONGLE_VERSION] = [b"\xff\xfe"]
+    ws = Open(fake_dongle.device, Events())
+    try:
+        assert ws.Capabilities["mac"] == MAC
+        assert ws.Capabilities["version"] == "\ufffd\ufffd"
+    finally:
+        ws.Stop()
+
+
+def test_event_is_delivered_and_acked(fake_dongle):
+    events = Events()
+    ws = Open(fake_dongle.device, events)
+    try:
+        fake_dongle.Write(alarm("777A4656", 1))
+        assert events.wait(lambda ev: ev)
+        assert events.states({"777A4656"}) == [("777A4656", "active")]
+        # The reader thread may not have picked up the ACK yet
+        assert fake_dongle.wait_received(lambda p: p.Cmd == Packet.ASYNC_ACK and p.Payload == Packet.NOTIFY_SENSOR_ALARM)
+    finally:
+        ws.Stop()
+
+
+def test_corrupted_length_byte_resyncs(fake_dongle):
+    events = Events()
+    ws = Open(fake_dongle.device, events)
+    try:
+        fake_dongle.Write(bytes.fromhex("55aa53f019") + alarm("777A4656", 1))
+        assert events.wait(lambda ev: ev)
+        assert ws.List() == []
+    finally:
+        ws.Stop()
+
+
+def test_handler_error_keeps_queued_frames(fake_dongle):
+    events = Events()
+    ws = Open(fake_dongle.device, events)
+    try:
+        # A truncated event log packet makes its handler raise
+        bad_log = frame(Packet.NOTIFY_EVENT_LOG, b"\x00")
+        fake_dongle.Write(bad_log + alarm("777A4656", 1))
+        assert events.wait(lambda ev: ev)
+    finally:
+        ws.Stop()
+
+
+@settings(max_examples=10, deadline=None, suppress_health_check=[HealthCheck.too_slow])
+@given(st.lists(st.tuples(st.lists(noise, max_size=2), st.booleans()), min_size=1, max_size=6))
+def test_interleaved_noise(segments):
+    macs = ["7779%04X" % i for i in range(len(segments))]
+    expected = [(mac, "active" if state else "inactive") for mac, (_, state) in zip(macs, segments)]
+
+    dongle = FakeDongle()
+    events = Events()
+    ws = Open(dongle.device, events)
+    try:
+        for mac, (junk, state) in zip(macs, segments):
+            dongle.Write(b"".join(junk))
+            # Let a stalled frame time out the way a quiet line would
+            time.sleep(0.3)
+            dongle.Write(alarm(mac, int(state)))
+
+        events.wait(lambda ev: len(events.states(set(macs))) >= len(macs))
+        assert events.states(set(macs)) == expected
+    finally:
+        ws.Stop()
+        dongle.Close()
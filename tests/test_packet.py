@@ -0,0 +1,124 @@
+import struct
+
+from hypothesis import given, strategies as st
+
+from custom_components.wyzesense.wyzesense_custom import (
+    Framer, IncompleteFrame, InvalidFrame, Packet, ParseError)
+
+from fake_dongle import frame
+from strategies import commands, frames, noise, payloads
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def drain(framer, clock, chunks):
+    """Feeds every chunk, then lets any stalled frame time out."""
+    packets = []
+    for chunk in chunks:
+        packets += framer.Feed(chunk)
+    for _ in range(3):
+        clock.now += 1
+        packets += framer.Feed(b"")
+    return packets
+
+
+def split(data, cuts):
+    cuts = sorted(set(c % (len(data) + 1) for c in cuts))
+    return [data[i:j] for i, j in zip([0] + cuts, cuts + [len(data)])]
+
+
+@given(commands, payloads)
+def test_parse_round_trip(cmd, payload):
+    pkt = Packet.Parse(frame(cmd, payload))
+    assert pkt
+    assert pkt.Cmd == cmd
+    assert pkt.Payload == payload
+    assert pkt.Length == len(payload) + 7
+
+
+def test_parse_ack():
+    head = struct.pack(">HBBB", 0x55AA, 0x53, 0x19, 0xFF)
+    pkt = Packet.Parse(head + struct.pack(">H", sum(head)))
+    assert pkt.Cmd == Packet.ASYNC_ACK
+    assert pkt.Payload == Packet.NOTIFY_SENSOR_ALARM
+    assert isinstance(Packet.Parse(head), IncompleteFrame)
+
+
+@given(st.binary(max_size=300))
+def test_parse_never_raises(data):
+    pkt = Packet.Parse(data)
+    if isinstance(pkt, ParseError):
+        assert not pkt
+        assert str(pkt)
+    else:
+        assert pkt.Length <= len(data)
+
+
+@given(frames, st.data())
+def test_parse_truncated(data, draw):
+    cut = draw.draw(st.integers(min_value=0, max_value=len(data) - 1))
+    assert isinstance(Packet.Parse(data[:cut]), IncompleteFrame)
+
+
+@given(frames, st.data())
+def test_parse_corrupted(data, draw):
+    # Corrupt anything after the magic, except the length byte
+    index = draw.draw(st.integers(min_value=2, max_value=len(data) - 1).filter(lambda i: i != 3))
+    value = draw.draw(st.integers(min_value=0, max_value=0xFF).filter(lambda v: v != data[index]))
+    corrupted = data[:index] + bytes([value]) + data[index + 1:]
+    assert not Packet.Parse(corrupted)
+
+
+def test_parse_invalid_length():
+    assert isinstance(Packet.Parse(b"\x55\xAA\x53\x02\x19\x00\x00"), InvalidFrame)
+
+
+@given(st.lists(frames, max_size=10), st.lists(st.integers(min_value=0), max_size=10))
+def test_framer_reassembles_split_frames(packets, cuts):
+    clock = FakeClock()
+    data = b"".join(packets)
+    result = drain(Framer(clock), clock, split(data, cuts))
+    assert [f for _, f in result] == packets
+
+
+@given(st.lists(st.tuples(st.lists(noise, max_size=2), frames), max_size=8),
+       st.lists(st.integers(min_value=0), max_size=10))
+def test_framer_resyncs_after_noise(segments, cuts):
+    clock = FakeClock()
+    framer = Framer(clock)
+    packets = []
+    expected = []
+    for junk, good in segments:
+        for chunk in split(b"".join(junk), cuts):
+            packets += framer.Feed(chunk)
+        # Garbage with a corrupted length byte is only dropped once it times out
+        clock.now += 1
+        packets += framer.Feed(b"")
+        packets += framer.Feed(good)
+        expected.append(good)
+
+    packets += drain(framer, clock, [])
+    # Noise may happen to contain a valid frame, but every good frame must get through
+    received = iter([f for _, f in packets])
+    assert all(any(f == good for f in received) for good in expected)
+
+
+def test_framer_drops_stale_partial_frame():
+    clock = FakeClock()
+    framer = Framer(clock)
+    assert framer.Feed(bytes.fromhex("55aa00040f4301")) == []
+    clock.now += 1
+    good = bytes.fromhex("55aa4303000145")
+    assert [f for _, f in framer.Feed(good)] == [good]
+
+
+@given(st.lists(st.binary(max_size=64), max_size=20))
+def test_framer_never_raises(chunks):
+    clock = FakeClock()
+    for pkt, data in drain(Framer(clock), clock, chunks):
+        assert pkt.Length == len(data)
@@ -0,0 +1,88 @@
+import datetime
+import time
+
+from custom_components.wyzesense.wyzesense_custom import Open, Packet, RemoteDongle, SensorEvent, _EventRecord
+
+from fake_dongle import Events, MAC, alarm
+
+
+class Dongle(object):
+    def __init__(self, offset, latency):
+        self.ClockOffset = offset
+        self.Latency = latency
+
+
+def test_event_record_state():
+    e = SensorEvent("777A4656", datetime.datetime(2026, 1, 2, 3, 4, 5, 678000), "state",
+                    ("motion", "active", 95, 40), 0.25)
+    record = _EventRecord.Pack(Dongle(1.5, 0.2), e)
+    assert len(record) == _EventRecord.Size
+
+    e2, offset, latency = _EventRecord.Unpack(record)
+    assert (e2.MAC, e2.Timestamp, e2.Type, e2.Data, e2.Latency) == (e.MAC, e.Timestamp, e.Type, e.Data, e.Latency)
+    assert (offset, latency) == (1.5, 0.2)
+
+
+def test_event_record_unknown_clock():
+    e = SensorEvent("777A4656", datetime.datetime.now(), "state", ("switch", "open", 90, 50))
+    e2, offset, latency = _EventRecord.Unpack(_EventRecord.Pack(Dongle(None, None), e))
+    assert e2.Latency is None
+    assert offset is None
+    assert latency is None
+
+
+def test_event_record_raw():
+    e = SensorEvent("777A4656", datetime.datetime.now(), "raw_A3", bytes(range(80)), 0.1)
+    e2, _, _ = _EventRecord.Unpack(_EventRecord.Pack(Dongle(0.0, 0.1), e))
+    assert e2.Type == "raw_A3"
+    # Raw data is truncated to fit the fixed-size record
+    assert e2.Data == bytes(range(64))
+
+
+def test_remote_dongle(fake_dongle):
+    events = Events()
+    fake_dongle.responses[Packet.CMD_GET_SENSOR_COUNT] = [b"\x01"]
+    fake_dongle.responses[Packet.CMD_GET_SENSOR_LIST] = [b"777A4656"]
+    ws = Open(fake_dongle.device, events, isolated=True)
+    try:
+        assert isinstance(ws, RemoteDongle)
+        assert ws.Capabilities["mac"] == MAC
+        fake_dongle.Write(alarm("777A4656", 1))
+        assert events.wait(lambda ev: ev)
+        assert events.states({"777A4656"}) == [("777A4656", "active")]
+        assert ws.List() == ["777A4656"]
+    finally:
+        ws.Stop()
+
+
+def test_remote_dongle_refreshes_capabilities(fake_dongle):
+    stale = {"enr": "30" * 16, "mac": "00000000", "version": "0.0.0.1"}
+    ws = Open(fake_dongle.device, Events(), isolated=True, capabilities=stale)
+    try:
+        assert ws.Capabilities == stale
+        assert ws.RefreshCapabilities()["mac"] == MAC
+        assert ws.Capabilities["mac"] == MAC
+    finally:
+        ws.Stop()
+
+
+def test_remote_dongle_restarts_driver(fake_dongle):
+    events = Events()
+    ws = Open(fake_dongle.device, events, isolated=True)
+    try:
+        ws._RemoteDongle__process.kill()
+        # Commands fail until the driver is back
+        deadline = time.time() + 10
+        while True:
+            try:
+                assert ws.List() == []
+                break
+            except OSError:
+                assert time.time() < deadline
+                time.sleep(0.2)
+
+        fake_dongle.Write(alarm("777A4656", 0))
+        assert events.wait(lambda ev: ev)
+        assert events.states({"777A4656"}) == [("777A4656", "inactive")]
+    finally:
+        ws.Stop()
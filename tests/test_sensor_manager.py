@@ -0,0 +1,133 @@
+import json
+
+from custom_components.wyzesense.sensor_manager import SensorManager
+
+
+class Hub(object):
+    def __init__(self, bound=(), error=None):
+        self.bound = list(bound)
+        self.error = error
+        self.deleted = []
+
+    def List(self):
+        if self.error:
+            raise self.error
+        return list(self.bound)
+
+    def Delete(self, mac):
+        if self.error:
+            raise self.error
+        self.deleted.append(mac)
+        self.bound.remove(mac)
+
+
+class Platform(object):
+    """Storage and entities as binary_sensor keeps them, counting writes."""
+
+    def __init__(self, tmp_path, hub, macs=()):
+        self.storage = list(macs)
+        self.entities = {mac: object() for mac in macs}
+        self.writes = 0
+        self.hub = hub
+        self.manager = SensorManager(hub, self.entities, lambda: list(self.storage), self.set_storage,
+                                     self.add_entities, self.remove_entities, str(tmp_path))
+
+    def set_storage(self, data):
+        self.writes += 1
+        self.storage = data
+
+    def add_entities(self, macs):
+        added = [mac for mac in macs if mac not in self.entities]
+        for mac in added:
+            self.entities[mac] = object()
+        return added
+
+    def remove_entities(self, macs):
+        for mac in macs:
+            self.entities.pop(mac, None)
+
+
+def test_remove_deduplicates(tmp_path):
+    platform = Platform(tmp_path, Hub(["777A4656", "77793176"]), ["777A4656", "77793176"])
+    message = platform.manager.remove(["777a4656", "777A4656 ", "00000000"])
+    assert platform.hub.deleted == ["777A4656"]
+    assert platform.storage == ["77793176"]
+    assert list(platform.entities) == ["77793176"]
+    assert platform.writes == 1
+    assert "Successfully removed sensors: 777A4656" in message
+    assert "No sensors found to remove for: 00000000" in message
+    assert "Failed" not in message
+
+
+def test_remove_rejects_empty(tmp_path):
+    platform = Platform(tmp_path, Hub(), ["777A4656"])
+    assert platform.manager.remove(["", " "]) == "No sensors given to remove."
+    assert platform.writes == 0
+
+
+def test_remove_reports_hub_errors(tmp_path):
+    platform = Platform(tmp_path, Hub(["777A4656"], TimeoutError()), ["777A4656"])
+    assert platform.manager.remove(["777A4656"]) == "Failed to remove sensors: 777A4656"
+    assert platform.storage == ["777A4656"]
+    assert platform.writes == 0
+
+
+def test_reconcile_writes_storage_once(tmp_path):
+    platform = Platform(tmp_path, Hub(["777A4656", "7779AAAA"]), ["777A4656", "77793176"])
+    message = platform.manager.reconcile()
+    assert platform.writes == 1
+    assert platform.storage == ["777A4656", "7779AAAA"]
+    assert set(platform.entities) == {"777A4656", "7779AAAA"}
+    assert "Added: 7779AAAA" in message
+    assert "Removed: 77793176" in message
+
+
+def test_reconcile_keeps_sensors_when_hub_lists_none(tmp_path):
+    platform = Platform(tmp_path, Hub([]), ["777A4656", "77793176"])
+    message = platform.manager.reconcile()
+    assert "none of the 2 known sensors were removed" in message
+    assert platform.writes == 0
+    assert set(platform.entities) == {"777A4656", "77793176"}
+
+
+def test_reconcile_reports_list_failure(tmp_path):
+    platform = Platform(tmp_path, Hub(error=OSError("gone")), ["777A4656"])
+    assert platform.manager.reconcile().startswith("Reconcile failed")
+    assert platform.writes == 0
+
+
+def test_export_and_import(tmp_path):
+    platform = Platform(tmp_path, Hub(), ["777A4656", "77793176"])
+    assert platform.manager.export("backup.json").startswith("Exported 2 sensors")
+    # Overwriting an earlier export is fine
+    assert platform.manager.export("backup.json").startswith("Exported 2 sensors")
+
+    restored = Platform(tmp_path, Hub(), ["777A4656"])
+    assert restored.manager.restore("backup.json").startswith("Imported 1 new sensors")
+    assert restored.storage == ["777A4656", "77793176"]
+    assert restored.writes == 1
+
+
+def test_export_refuses_other_files(tmp_path):
+    platform = Platform(tmp_path, Hub(), ["777A4656"])
+    config = tmp_path / "configuration.yaml"
+    config.write_text("homeassistant:\n")
+    assert platform.manager.export("configuration.yaml").startswith("Refusing to overwrite")
+    assert config.read_text() == "homeassistant:\n"
+    assert platform.manager.export("../outside.json").startswith("Refusing to export outside")
+    assert platform.manager.export(str(tmp_path.parent / "outside.json")).startswith("Refusing")
+    assert not (tmp_path.parent / "outside.json").exists()
+
+
+def test_export_reports_write_errors(tmp_path):
+    platform = Platform(tmp_path, Hub(), ["777A4656"])
+    assert platform.manager.export("missing/backup.json").startswith("Could not write sensor export")
+
+
+def test_import_reports_invalid_entries(tmp_path):
+    (tmp_path / "backup.json").write_text(json.dumps(["777a4656", "777A4656", "short", 7]))
+    platform = Platform(tmp_path, Hub())
+    message = platform.manager.restore("backup.json")
+    assert platform.storage == ["777A4656"]
+    assert "Imported 1 new sensors" in message
+    assert "Ignored invalid entries: 'short', 7" in message
@@ -0,0 +1,157 @@
+from custom_components.wyzesense.state_hold import StateHold
+
+MAC = "777A4656"
+
+
+class Timers(object):
+    """A fake clock and shared timer that only fire when a test says so."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timer = None
+        self.calls = 0
+
+    def __call__(self):
+        return self.now
+
+    def schedule(self, delay, action):
+        self.calls += 1
+        self.timer = None if delay is None else (self.now + delay, action)
+
+    def advance(self, seconds):
+        self.now += seconds
+        while self.timer and self.timer[0] <= self.now:
+            action = self.timer[1]
+            self.timer = None
+            action(self.now)
+
+    @property
+    def pending(self):
+        return self.timer is not None
+
+
+class Sensor(object):
+    def __init__(self, options):
+        self.state = 0
+        self.history = []
+        self.timers = Timers()
+        self.hold = StateHold({MAC: options}, lambda mac: self.state, self.commit,
+                              self.timers.schedule, clock=self.timers)
+
+    def commit(self, mac, data):
+        self.state = data
+        self.history.append(data)
+
+    def event(self, state):
+        self.hold.apply(MAC, state, state)
+
+
+def test_sensor_without_options_is_immediate():
+    sensor = Sensor((5, 5, 5))
+    sensor.hold.apply("77793176", 1, "data")
+    assert sensor.history == ["data"]
+    assert not sensor.timers.pending
+
+
+def test_debounce_drops_short_blips():
+    sensor = Sensor((2, 0, 0))
+    sensor.event(1)
+    sensor.timers.advance(1)
+    sensor.event(0)
+    sensor.timers.advance(5)
+    # The revert re-commits the unchanged state, but the blip never shows
+    assert sensor.history == [0]
+
+    sensor.event(1)
+    sensor.timers.advance(2)
+    assert sensor.history == [0, 1]
+
+
+def test_min_on_time_defers_off():
+    sensor = Sensor((0, 10, 0))
+    sensor.event(1)
+    assert sensor.history == [1]
+    sensor.timers.advance(3)
+    sensor.event(0)
+    sensor.timers.advance(6)
+    assert sensor.state == 1
+    sensor.timers.advance(1)
+    assert sensor.history == [1, 0]
+
+
+def test_off_delay_is_cancelled_by_on():
+    sensor = Sensor((0, 0, 30))
+    sensor.event(1)
+    sensor.event(0)
+    sensor.timers.advance(20)
+    sensor.event(1)
+    sensor.timers.advance(60)
+    assert sensor.history == [1, 1]
+    assert not sensor.timers.pending
+
+
+def test_superseded_commit_is_dropped():
+    sensor = Sensor((0, 0, 30))
+    sensor.event(1)
+    sensor.event(0)
+    action = sensor.timers.timer[1]
+    # The sensor turns back on just as the off-delay timer goes off
+    sensor.event(1)
+    sensor.timers.now += 30
+    action(sensor.timers.now)
+    assert sensor.state == 1
+    assert sensor.history == [1, 1]
+
+
+def test_early_timer_is_rearmed():
+    sensor = Sensor((0, 0, 30))
+    sensor.event(1)
+    sensor.event(0)
+    deadline, action = sensor.timers.timer
+    sensor.timers.now = deadline - 1
+    action(sensor.timers.now)
+    assert sensor.history == [1]
+    assert sensor.timers.timer[0] == deadline
+    sensor.timers.advance(1)
+    assert sensor.history == [1, 0]
+
+
+def test_sensors_share_one_timer():
+    timers = Timers()
+    states = {"777A4656": 0, "77793176": 0}
+    history = []
+
+    def commit(mac, data):
+        states[mac] = data
+        history.append((mac, data))
+
+    hold = StateHold({mac: (0, 0, 10) for mac in states}, states.get, commit, timers.schedule, clock=timers)
+    hold.apply("777A4656", 1, 1)
+    hold.apply("777A4656", 0, 0)
+    timers.advance(4)
+    hold.apply("77793176", 1, 1)
+    hold.apply("77793176", 0, 0)
+    # A later deadline doesn't move the timer
+    assert timers.timer[0] == 10
+    calls = timers.calls
+    timers.advance(6)
+    assert history[-1] == ("777A4656", 0)
+    assert timers.timer[0] == 14
+    timers.advance(4)
+    assert history[-1] == ("77793176", 0)
+    assert not timers.pending
+    # One new timer once the first went off, nothing to cancel after the last
+    assert timers.calls == calls + 1
+
+
+def test_cancel_and_stop():
+    sensor = Sensor((0, 0, 30))
+    sensor.event(1)
+    sensor.event(0)
+    sensor.hold.cancel(MAC)
+    assert not sensor.timers.pending
+
+    sensor.event(0)
+    sensor.hold.stop()
+    sensor.timers.advance(60)
+    assert sensor.history == [1]
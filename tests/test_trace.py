@@ -0,0 +1,30 @@
+import pytest
+
+from custom_components.wyzesense.wyzesense_custom import Open, Packet, PacketTrace
+
+from fake_dongle import Events, alarm
+
+
+@pytest.mark.parametrize("isolated", [False, True])
+def test_trace_round_trip(fake_dongle, tmp_path, isolated):
+    path = str(tmp_path / "trace.bin")
+    events = Events()
+    ws = Open(fake_dongle.device, events, isolated=isolated)
+    try:
+        ws.StartTrace(path)
+        notification = alarm("777A4656", 1)
+        fake_dongle.Write(notification)
+        assert events.wait(lambda ev: ev)
+        ws.StopTrace()
+
+        # Not traced once stopped
+        fake_dongle.Write(alarm("777A4656", 0))
+        assert events.wait(lambda ev: len(ev) == 2)
+    finally:
+        ws.Stop()
+
+    records = [(direction, data) for _, direction, data in PacketTrace.Read(path)]
+    assert records == [
+        (PacketTrace.RX, notification),
+        (PacketTrace.TX, Packet.AsyncAck(Packet.NOTIFY_SENSOR_ALARM).Encode()),
+    ]